@@ -1,138 +1,360 @@
+import threading
+import time
 import streamlit as st
 from PIL import Image
 import requests
 import pandas as pd
 from geopy.distance import geodesic
+import profiling
+from cache import Cache, cache_key, make_backend
+from scheduler import INTERACTIVE, PREFETCH, QueueFull, Scheduler
 
 # --- CONFIGURATION ---
 API_URL = "https://y-trust-003-51424904642.europe-west1.run.app/api/recipescore"
 INGREDIENTS_API_URL = "https://y-trust-003-51424904642.europe-west1.run.app/api/ingredients/predict"
 RECIPE_API_URL = "https://y-trust-003-51424904642.europe-west1.run.app/api/recipe"
+GEOCODE_URL = "https://nominatim.openstreetmap.org/search"
+MEAL_TYPES = ["breakfast", "lunch", "dinner"]
+INFLIGHT_WAIT_S = 10  # max wait for an identical request already in flight
+GEOCODE_MIN_INTERVAL_S = 2  # per session, between two geocode submissions
+GEOCODE_HISTORY_SIZE = 20  # addresses kept per session for suggestions
+SUGGESTION_RADIUS_KM = 20
 
-# Load and set logo as icon
-#logo = Image.open("/Users/aurelie/code/Y-TRUST-FRONT-END/logo Y-trust.png")
-#st.set_page_config(page_title="Y-TRUST", page_icon=logo, layout="centered")
-st.title("Y-TRUST")
-
-# --- SEARCH BAR ---
-st.markdown("#### 🔍 What recipe are you looking for?")
-with st.form("search_form", clear_on_submit=False):
-    col1, col2 = st.columns([5, 1])
-    with col1:
-        recipe_query = st.text_input("", placeholder="e.g. Bolognese sauce ...", key="recipe_input")
-    with col2:
-        submitted = st.form_submit_button("Search")
-if submitted and recipe_query.strip():
-    st.session_state["recipe_selected"] = recipe_query.strip()
-
-# --- MEAL SELECTION & NUTRI SCORE ---
-if "recipe_selected" in st.session_state:
-    st.markdown("#### 🍽️ Select the meal type")
-    meal_type = st.selectbox("Meal", ["🍽️ Select your meal", "breakfast", "lunch", "dinner"], key="meal_select")
-
-    if meal_type != "🍽️ Select your meal":
-        with st.spinner("Fetching nutrition score..."):
-            try:
-                resp = requests.post(API_URL, json={"recipe_name": st.session_state["recipe_selected"], "meal_type": meal_type})
-                resp.raise_for_status()
-                data = resp.json()
-
-                nutri = data.get("nutri_score")
-                if isinstance(nutri, dict):
-                    st.markdown("#### 🥗 Nutrition Breakdown")
-                    pictos = {"Energy_ratio":"⚡️","Carbohydrates_ratio":"🍞","Proteins_ratio":"🐟","Fat_ratio":"🧈"}
-                    labels = {"Energy_ratio":"Energy","Carbohydrates_ratio":"Carbohydrates","Proteins_ratio":"Proteins","Fat_ratio":"Fat"}
-                    for k, v in nutri.items():
-                        if k in labels:
-                            emoji, label = pictos[k], labels[k]
-                            color = "#e74c3c" if v > 1 else "#2ecc71"
-                            st.markdown(f"<div style='display:flex; align-items:center;'>"
-                                        f"{emoji}<strong>{label}:</strong>"
-                                        f"<span style='background:{color};color:#fff;padding:3px 8px;border-radius:8px;margin-left:4px;'>{v:.2f}</span>"
-                                        f"</div>", unsafe_allow_html=True)
+# Outbound limits per host, shared by every session of this process.
+# Nominatim usage policy: at most 1 request per second.
+HOST_LIMITS = {
+    "nominatim.openstreetmap.org": {"rate": 1, "burst": 1, "max_queue": 5, "max_wait": 3.0},
+    "y-trust-003-51424904642.europe-west1.run.app": {"rate": 5, "burst": 10, "max_queue": 20, "max_wait": 5.0},
+}
+
+
+# --- SHARED CACHE ---
+# One backend per process, shared by all sessions; pick sqlite/redis with
+# YTRUST_CACHE_BACKEND so every replica behind the load balancer shares it.
+@st.cache_resource
+def get_cache():
+    return Cache(make_backend())
+
+
+@st.cache_resource
+def get_scheduler():
+    return Scheduler(HOST_LIMITS)
+
+
+def fetch_json(url, payload, priority=INTERACTIVE, cache=None, scheduler=None):
+    """POST `payload` to the backend through the shared cache and the outbound scheduler.
+
+    When the host queue is full, fall back to a stale cached response if there is one.
+    If the same request is already in flight in this process (e.g. a prefetch), wait
+    for it instead of sending it again.
+    `cache`/`scheduler` default to the process-wide ones; background threads pass them
+    explicitly since they have no Streamlit script context.
+    """
+    cache = cache or get_cache()
+    scheduler = scheduler or get_scheduler()
+    key = cache_key(url, payload)
+    data = cache.get(key)
+    if data is not None:
+        return data
+    leader, event = cache.inflight.begin(key)
+    if not leader:
+        event.wait(INFLIGHT_WAIT_S)
+        data = cache.get(key)
+        if data is not None:
+            return data
+    try:
+        try:
+            scheduler.acquire(url, priority)
+        except QueueFull:
+            data = cache.get(key, stale=True)
+            if data is None:
+                raise
+            return data
+        resp = requests.post(url, json=payload)
+        resp.raise_for_status()
+        data = resp.json()
+        cache.set(key, data)
+        return data
+    finally:
+        if leader:
+            cache.inflight.end(key)
+
+
+def prefetch_recipe(recipe_name):
+    """Warm the cache with the /api/recipe response of `recipe_name` in the background.
+
+    The nutrition score depends on the meal type, so it is only fetched once the
+    user picks one. Runs at PREFETCH priority, so it only uses spare backend
+    capacity; failures are counted in the scheduler metrics.
+    """
+    cache, scheduler = get_cache(), get_scheduler()
+    payload = {"recipe_name": recipe_name}
+
+    def warm():
+        try:
+            fetch_json(RECIPE_API_URL, payload, priority=PREFETCH, cache=cache, scheduler=scheduler)
+        except Exception:
+            scheduler.record_prefetch_failure(RECIPE_API_URL)
+
+    threading.Thread(target=warm, daemon=True).start()
+
+
+# --- GEOCODING ---
+# Addresses are only geocoded on explicit submit. The resolved location is kept
+# in st.session_state["user_location"] so later reruns (meal change, map redraw,
+# supplier distances) never geocode again. Addresses and coordinates stay in the
+# session: they are never written to the shared cache.
+def normalize_address(address):
+    return " ".join(address.lower().split())
+
+
+@st.cache_resource
+def get_geocode_stats():
+    """Process-wide Nominatim request counts, shown in the ?metrics=1 view."""
+    return {"lock": threading.Lock(), "requests": 0, "sessions_geocoding": 0}
+
+
+def count_geocode_request():
+    st.session_state["geocode_calls"] = st.session_state.get("geocode_calls", 0) + 1
+    stats = get_geocode_stats()
+    with stats["lock"]:
+        stats["requests"] += 1
+        if st.session_state["geocode_calls"] == 1:
+            stats["sessions_geocoding"] += 1
+
+
+def geocode_metrics():
+    stats = get_geocode_stats()
+    with stats["lock"]:
+        sessions = stats["sessions_geocoding"]
+        return {
+            "requests": stats["requests"],
+            "sessions_geocoding": sessions,
+            "requests_per_session": stats["requests"] / sessions if sessions else 0.0,
+            "requests_this_session": st.session_state.get("geocode_calls", 0),
+        }
+
+
+def located_address(address):
+    """Return the location of `address` if it was already resolved in this session, else None."""
+    query = normalize_address(address)
+    for loc in st.session_state.get("geocoded_addresses", []):
+        if normalize_address(loc["address"]) == query:
+            return loc
+    return None
+
+
+def geocode_address(address):
+    """Send one Nominatim request for `address`; return {"address", "lat", "lon"} or None if not found."""
+    get_scheduler().acquire(GEOCODE_URL)
+    count_geocode_request()
+    resp = requests.get(GEOCODE_URL, params={"q": normalize_address(address), "format": "json"},
+                        headers={"User-Agent": "Y-TRUST-App"})
+    resp.raise_for_status()
+    geo_data = resp.json()
+    if not geo_data:
+        return None
+    location = {"address": address.strip(), "lat": float(geo_data[0]["lat"]), "lon": float(geo_data[0]["lon"])}
+    history = st.session_state.setdefault("geocoded_addresses", [])
+    history.insert(0, location)
+    del history[GEOCODE_HISTORY_SIZE:]
+    return location
+
+
+def geocode_suggestions(text, near=None, limit=5):
+    """Addresses already located in this session matching `text`, or close to `near` once `text` is located."""
+    history = st.session_state.get("geocoded_addresses", [])
+    if near is not None:
+        history = [loc for loc in history if loc["address"] != near["address"]]
+    query = normalize_address(text)
+    if query and (near is None or query != normalize_address(near["address"])):
+        return [loc for loc in history if query in normalize_address(loc["address"])][:limit]
+    if near is None:
+        return []
+    nearby = [(geodesic((near["lat"], near["lon"]), (loc["lat"], loc["lon"])).km, loc) for loc in history]
+    nearby = [(d, loc) for d, loc in nearby if d <= SUGGESTION_RADIUS_KM]
+    return [loc for _, loc in sorted(nearby, key=lambda x: x[0])][:limit]
+
+
+def set_user_location(location):
+    current = st.session_state.get("user_location")
+    if current and current != location:
+        st.session_state["last_location"] = current
+    st.session_state["user_location"] = location
+
+
+def use_suggestion():
+    address = st.session_state.get("address_suggestion")
+    for loc in st.session_state.get("address_suggestions", []):
+        if loc["address"] == address:
+            set_user_location(loc)
+            st.session_state["user_address"] = loc["address"]
+
+
+def use_last_location():
+    set_user_location(st.session_state["last_location"])
+    st.session_state["user_address"] = st.session_state["user_location"]["address"]
+
+
+# --- PROFILING (admin only, see profiling.py) ---
+with profiling.profile_rerun():
+    # Load and set logo as icon
+    #logo = Image.open("/Users/aurelie/code/Y-TRUST-FRONT-END/logo Y-trust.png")
+    #st.set_page_config(page_title="Y-TRUST", page_icon=logo, layout="centered")
+    st.title("Y-TRUST")
+
+    # --- SEARCH BAR ---
+    st.markdown("#### 🔍 What recipe are you looking for?")
+    with st.form("search_form", clear_on_submit=False):
+        col1, col2 = st.columns([5, 1])
+        with col1:
+            recipe_query = st.text_input("", placeholder="e.g. Bolognese sauce ...", key="recipe_input")
+        with col2:
+            submitted = st.form_submit_button("Search")
+    if submitted and recipe_query.strip():
+        st.session_state["recipe_selected"] = recipe_query.strip()
+        prefetch_recipe(st.session_state["recipe_selected"])
+
+    # --- MEAL SELECTION & NUTRI SCORE ---
+    if "recipe_selected" in st.session_state:
+        st.markdown("#### 🍽️ Select the meal type")
+        meal_type = st.selectbox("Meal", ["🍽️ Select your meal"] + MEAL_TYPES, key="meal_select")
+
+        if meal_type != "🍽️ Select your meal":
+            with st.spinner("Fetching nutrition score..."):
+                try:
+                    data = fetch_json(API_URL, {"recipe_name": st.session_state["recipe_selected"], "meal_type": meal_type})
+
+                    nutri = data.get("nutri_score")
+                    if isinstance(nutri, dict):
+                        st.markdown("#### 🥗 Nutrition Breakdown")
+                        pictos = {"Energy_ratio":"⚡️","Carbohydrates_ratio":"🍞","Proteins_ratio":"🐟","Fat_ratio":"🧈"}
+                        labels = {"Energy_ratio":"Energy","Carbohydrates_ratio":"Carbohydrates","Proteins_ratio":"Proteins","Fat_ratio":"Fat"}
+                        for k, v in nutri.items():
+                            if k in labels:
+                                emoji, label = pictos[k], labels[k]
+                                color = "#e74c3c" if v > 1 else "#2ecc71"
+                                st.markdown(f"<div style='display:flex; align-items:center;'>"
+                                            f"{emoji}<strong>{label}:</strong>"
+                                            f"<span style='background:{color};color:#fff;padding:3px 8px;border-radius:8px;margin-left:4px;'>{v:.2f}</span>"
+                                            f"</div>", unsafe_allow_html=True)
+                    else:
+                        st.warning("No valid nutrition score returned.")
+                except QueueFull:
+                    st.warning("Too many requests right now, please retry in a few seconds.")
+                except Exception as e:
+                    st.error(f"Nutri API error: {e}")
+
+            # --- Address input ---
+            st.markdown("---")
+            st.markdown("### 📍 Enter your address to map suppliers")
+            with st.form("address_form", clear_on_submit=False):
+                col1, col2 = st.columns([5, 1])
+                with col1:
+                    user_address = st.text_input("Enter your full address", placeholder="e.g. 15 rue de la paix, Paris", key="user_address")
+                with col2:
+                    locate = st.form_submit_button("Locate")
+
+            current = st.session_state.get("user_location")
+            already_located = current and normalize_address(current["address"]) == normalize_address(user_address)
+            if locate and user_address.strip() and not already_located:
+                known = located_address(user_address)
+                if known:
+                    set_user_location(known)
+                elif time.monotonic() - st.session_state.get("last_geocode_at", 0) < GEOCODE_MIN_INTERVAL_S:
+                    st.info("Please wait a moment before locating another address.")
                 else:
-                    st.warning("No valid nutrition score returned.")
-            except Exception as e:
-                st.error(f"Nutri API error: {e}")
+                    st.session_state["last_geocode_at"] = time.monotonic()
+                    try:
+                        location = geocode_address(user_address)
+                        if location:
+                            set_user_location(location)
+                        else:
+                            st.warning("Could not geolocate the address.")
+                    except QueueFull:
+                        st.warning("Geolocation is busy, please retry in a few seconds.")
+                    except Exception as e:
+                        st.error(f"Error during geolocation: {e}")
+
+            suggestions = geocode_suggestions(user_address or "", st.session_state.get("user_location"))
+            st.session_state["address_suggestions"] = suggestions
+            if suggestions:
+                st.selectbox("Or pick an address you already used", [None] + [loc["address"] for loc in suggestions],
+                             format_func=lambda a: "—" if a is None else a,
+                             key="address_suggestion", on_change=use_suggestion)
+            if "last_location" in st.session_state:
+                st.button(f"📌 Use my last location ({st.session_state['last_location']['address']})", on_click=use_last_location)
 
-        # --- Address input ---
-        st.markdown("---")
-        st.markdown("### 📍 Enter your address to map suppliers")
-        user_address = st.text_input("Enter your full address", placeholder="e.g. 15 rue de la paix, Paris", key="user_address")
+            user_coords = None
+            map_points = []
+            location = st.session_state.get("user_location")
+            if location:
+                user_coords = (location["lat"], location["lon"])
+                map_points.append({"lat": location["lat"], "lon": location["lon"]})
+                st.success(f"📍 {location['address']}")
 
-        user_coords = None
-        map_points = []
-        if user_address:
+            # --- INGREDIENTS & ORIGIN FROM /api/recipe ---
             try:
-                geo = requests.get("https://nominatim.openstreetmap.org/search", params={"q": user_address, "format": "json"}, headers={"User-Agent": "Y-TRUST-App"})
-                geo.raise_for_status()
-                geo_data = geo.json()
-                if geo_data:
-                    lat = float(geo_data[0]["lat"])
-                    lon = float(geo_data[0]["lon"])
-                    user_coords = (lat, lon)
-                    map_points.append({"lat": lat, "lon": lon})
-                    st.success("Address geolocated and added to the map.")
-                else:
-                    st.warning("Could not geolocate the address.")
-            except Exception as e:
-                st.error(f"Error during geolocation: {e}")
+                st.markdown("### 🧾 Ingredient origin and suppliers")
+                recipe_json = fetch_json(RECIPE_API_URL, {"recipe_name": st.session_state["recipe_selected"]})
 
-        # --- INGREDIENTS & ORIGIN FROM /api/recipe ---
-        try:
-            st.markdown("### 🧾 Ingredient origin and suppliers")
-            recipe_data = requests.post(RECIPE_API_URL, json={"recipe_name": st.session_state["recipe_selected"]})
-            recipe_data.raise_for_status()
-            recipe_json = recipe_data.json()
-
-            all_ings = recipe_json.get("quantities_g", [])
-            if not all_ings:
-                st.warning("No ingredients returned for this recipe.")
-            else:
-                idf_suppliers = []
-                for i in all_ings:
-                    if i.get("is_idf_supplier") and i.get("latitude") and i.get("longitude"):
-                        lat = i.get("latitude")
-                        lon = i.get("longitude")
-                        supplier = {
-                            "name": i.get("matched_product"),
-                            "lat": lat,
-                            "lon": lon,
-                            "distance_km": geodesic(user_coords, (lat, lon)).km if user_coords else None
-                        }
-                        idf_suppliers.append(supplier)
-                        map_points.append({"lat": lat, "lon": lon})
-
-                if map_points:
-                    st.map(pd.DataFrame(map_points))
-
-                if idf_suppliers:
-                    st.markdown("### 🛒 Local Suppliers (IDF)")
-                    for s in idf_suppliers:
-                        dist = f" ({s['distance_km']:.1f} km)" if s.get("distance_km") else ""
-                        st.markdown(f"- **{s['name']}**{dist}")
+                all_ings = recipe_json.get("quantities_g", [])
+                if not all_ings:
+                    st.warning("No ingredients returned for this recipe.")
                 else:
-                    st.info("No local suppliers for this recipe.")
+                    idf_suppliers = []
+                    for i in all_ings:
+                        if i.get("is_idf_supplier") and i.get("latitude") and i.get("longitude"):
+                            lat = i.get("latitude")
+                            lon = i.get("longitude")
+                            supplier = {
+                                "name": i.get("matched_product"),
+                                "lat": lat,
+                                "lon": lon,
+                                "distance_km": geodesic(user_coords, (lat, lon)).km if user_coords else None
+                            }
+                            idf_suppliers.append(supplier)
+                            map_points.append({"lat": lat, "lon": lon})
 
-                # Grouping by country code
-                st.markdown("### 🌍 Ingredients by Origin")
-                origin_map = {0: ("Île-de-France", "🏙️"), 1: ("France", "🇫🇷"), 2: ("Europe", "🇪🇺"), 3: ("World", "🌍")}
-                grouped = {0: [], 1: [], 2: [], 3: []}
+                    if map_points:
+                        st.map(pd.DataFrame(map_points))
 
-                for i in all_ings:
-                    try:
-                        code = int(i.get("country_code", 3))
-                    except:
-                        code = 3
-                    grouped.setdefault(code, []).append(i.get("matched_product", "Unknown"))
-
-                for code in [0, 1, 2, 3]:
-                    label, emoji = origin_map[code]
-                    items = grouped.get(code, [])
-                    if items:
-                        st.markdown(f"#### {emoji} {label}")
-                        for item in items:
-                            st.markdown(f"- {item}")
-
-        except Exception as e:
-            st.error(f"Error while loading ingredient data: {e}")
+                    if idf_suppliers:
+                        st.markdown("### 🛒 Local Suppliers (IDF)")
+                        for s in idf_suppliers:
+                            dist = f" ({s['distance_km']:.1f} km)" if s.get("distance_km") else ""
+                            st.markdown(f"- **{s['name']}**{dist}")
+                    else:
+                        st.info("No local suppliers for this recipe.")
+
+                    # Grouping by country code
+                    st.markdown("### 🌍 Ingredients by Origin")
+                    origin_map = {0: ("Île-de-France", "🏙️"), 1: ("France", "🇫🇷"), 2: ("Europe", "🇪🇺"), 3: ("World", "🌍")}
+                    grouped = {0: [], 1: [], 2: [], 3: []}
+
+                    for i in all_ings:
+                        try:
+                            code = int(i.get("country_code", 3))
+                        except:
+                            code = 3
+                        grouped.setdefault(code, []).append(i.get("matched_product", "Unknown"))
+
+                    for code in [0, 1, 2, 3]:
+                        label, emoji = origin_map[code]
+                        items = grouped.get(code, [])
+                        if items:
+                            st.markdown(f"#### {emoji} {label}")
+                            for item in items:
+                                st.markdown(f"- {item}")
+
+            except Exception as e:
+                st.error(f"Error while loading ingredient data: {e}")
+
+    # --- OPERATOR METRICS (?metrics=1, no user data) ---
+    if st.query_params.get("metrics") == "1":
+        with st.expander("📊 Cache and outbound queue metrics", expanded=True):
+            st.json({
+                "cache_latency": get_cache().latency_histogram(),
+                "outbound": get_scheduler().metrics(),
+                "geocoding": geocode_metrics(),
+            })
@@ -0,0 +1,249 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+# --- CONFIGURATION ---
+# YTRUST_CACHE_BACKEND: "memory" (default), "sqlite" or "redis"
+# YTRUST_CACHE_URL: sqlite file path (shared volume) or redis://host:port/db
+CACHE_BACKEND = os.environ.get("YTRUST_CACHE_BACKEND", "memory")
+CACHE_URL = os.environ.get("YTRUST_CACHE_URL", "")
+DEFAULT_TTL = int(os.environ.get("YTRUST_CACHE_TTL", "3600"))
+# How long expired entries stay readable as a fallback (get(key, stale=True))
+STALE_TTL = int(os.environ.get("YTRUST_CACHE_STALE_TTL", "86400"))
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, float("inf"))
+
+
+# --- SERIALIZATION ---
+# Entries are stored as: 8-byte big-endian expiry (ms since epoch) + zlib(compact JSON).
+# The nutrition and ingredient payloads are small, repetitive dicts so they
+# compress well, and every backend only ever sees opaque bytes.
+def encode(value, ttl):
+    expires_ms = int((time.time() + ttl) * 1000)
+    body = json.dumps(value, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    return expires_ms.to_bytes(8, "big") + zlib.compress(body, 6)
+
+
+def decode(blob):
+    expires_at = int.from_bytes(blob[:8], "big") / 1000
+    value = json.loads(zlib.decompress(blob[8:]).decode("utf-8"))
+    return expires_at, value
+
+
+# --- BACKENDS ---
+class CacheBackend:
+    """Stores opaque bytes by key. Subclasses implement _get and _set."""
+
+    name = "base"
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histogram = {"get": [0] * len(LATENCY_BUCKETS), "set": [0] * len(LATENCY_BUCKETS)}
+
+    def get(self, key):
+        start = time.perf_counter()
+        try:
+            return self._get(key)
+        finally:
+            self._observe("get", time.perf_counter() - start)
+
+    def set(self, key, blob, ttl):
+        start = time.perf_counter()
+        try:
+            self._set(key, blob, ttl)
+        finally:
+            self._observe("set", time.perf_counter() - start)
+
+    def _observe(self, op, elapsed):
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if elapsed <= bound:
+                with self._lock:
+                    self._histogram[op][i] += 1
+                return
+
+    def latency_histogram(self):
+        """Return {op: {bucket_upper_bound: count}} for this backend."""
+        with self._lock:
+            return {op: dict(zip(LATENCY_BUCKETS, counts)) for op, counts in self._histogram.items()}
+
+    def _get(self, key):
+        raise NotImplementedError
+
+    def _set(self, key, blob, ttl):
+        raise NotImplementedError
+
+
+class MemoryBackend(CacheBackend):
+    """Per-process LRU. Fine for a single replica or local development."""
+
+    name = "memory"
+
+    def __init__(self, max_entries=1024):
+        super().__init__()
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+
+    def _get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            blob, hard_expiry = entry
+            if hard_expiry < time.time():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return blob
+
+    def _set(self, key, blob, ttl):
+        with self._lock:
+            self._data[key] = (blob, time.time() + ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+
+class SQLiteBackend(CacheBackend):
+    """SQLite file shared between replicas through a mounted volume.
+
+    Uses the default rollback journal (not WAL, which needs shared memory on a
+    single host), so the volume must support POSIX file locks.
+    """
+
+    name = "sqlite"
+    PRUNE_EVERY = 100  # sets between two deletions of expired rows
+
+    def __init__(self, path="ytrust_cache.sqlite3"):
+        super().__init__()
+        self.path = path
+        self._local = threading.local()
+        self._sets = 0
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL NOT NULL)"
+            )
+
+    def _connect(self):
+        # sqlite3 connections must not be shared across threads, and Streamlit
+        # runs each session's script in its own thread.
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            self._local.conn = conn
+        return conn
+
+    def _get(self, key):
+        row = self._connect().execute(
+            "SELECT value FROM cache WHERE key = ? AND expires_at >= ?", (key, time.time())
+        ).fetchone()
+        return row[0] if row else None
+
+    def _set(self, key, blob, ttl):
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, sqlite3.Binary(blob), time.time() + ttl),
+            )
+        with self._lock:
+            self._sets += 1
+            prune = self._sets % self.PRUNE_EVERY == 0
+        if prune:
+            self.prune()
+
+    def prune(self):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM cache WHERE expires_at < ?", (time.time(),))
+
+
+class RedisBackend(CacheBackend):
+    """Any Redis-protocol server (Redis, Valkey, KeyDB, Memorystore...)."""
+
+    name = "redis"
+
+    def __init__(self, url="redis://localhost:6379/0"):
+        super().__init__()
+        import redis  # optional dependency (pip install redis), only needed for this backend
+
+        self.client = redis.Redis.from_url(url, socket_timeout=0.5, socket_connect_timeout=0.5)
+
+    def _get(self, key):
+        return self.client.get(key)
+
+    def _set(self, key, blob, ttl):
+        self.client.set(key, blob, ex=max(1, int(ttl)))
+
+
+BACKENDS = {"memory": MemoryBackend, "sqlite": SQLiteBackend, "redis": RedisBackend}
+
+
+def make_backend(kind=CACHE_BACKEND, url=CACHE_URL):
+    try:
+        backend_cls = BACKENDS[kind]
+    except KeyError:
+        raise ValueError(f"Unknown cache backend {kind!r}, expected one of {sorted(BACKENDS)}")
+    return backend_cls(url) if url else backend_cls()
+
+
+# --- CACHE ---
+class InFlight:
+    """Tracks keys being loaded in this process, so concurrent misses on one key
+    wait for the first load instead of repeating it."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._events = {}
+
+    def begin(self, key):
+        """Return (True, event) if the caller should load `key`, else (False, event) to wait on."""
+        with self._lock:
+            event = self._events.get(key)
+            if event is not None:
+                return False, event
+            event = self._events[key] = threading.Event()
+            return True, event
+
+    def end(self, key):
+        with self._lock:
+            event = self._events.pop(key, None)
+        if event is not None:
+            event.set()
+
+
+class Cache:
+    """JSON-value cache on top of a byte backend. Backend and decode errors count as misses."""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.inflight = InFlight()
+
+    def get(self, key, stale=False):
+        """Return the cached value, or None. With stale=True, expired entries
+        still within STALE_TTL are returned too."""
+        try:
+            blob = self.backend.get(key)
+            if blob is None:
+                return None
+            expires_at, value = decode(bytes(blob))
+        except Exception:
+            return None
+        if expires_at < time.time() and not stale:
+            return None
+        return value
+
+    def set(self, key, value, ttl=DEFAULT_TTL):
+        try:
+            self.backend.set(key, encode(value, ttl), ttl + STALE_TTL)
+        except Exception:
+            pass
+
+    def latency_histogram(self):
+        return self.backend.latency_histogram()
+
+
+def cache_key(*parts):
+    return ":".join(["ytrust"] + [json.dumps(p, sort_keys=True, separators=(",", ":")) for p in parts])
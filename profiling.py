@@ -0,0 +1,94 @@
+import cProfile
+import hmac
+import io
+import os
+import pstats
+import time
+import uuid
+from contextlib import contextmanager
+
+import streamlit as st
+
+# --- CONFIGURATION ---
+# YTRUST_PROFILE=1 profiles every rerun (use on a dedicated replica only).
+# Otherwise a single rerun is profiled with ?profile=1&token=<YTRUST_PROFILE_TOKEN>
+# (both params are removed from the URL afterwards);
+# without a configured token the query param is ignored.
+# YTRUST_PROFILER: "cprofile" (default) or "sampling" (needs pyinstrument).
+PROFILE_ENV = os.environ.get("YTRUST_PROFILE", "") == "1"
+PROFILE_TOKEN = os.environ.get("YTRUST_PROFILE_TOKEN", "")
+PROFILER = os.environ.get("YTRUST_PROFILER", "cprofile")
+PROFILE_DIR = os.environ.get("YTRUST_PROFILE_DIR", "profiles")
+TOP_N = 30
+
+
+def requested():
+    if PROFILE_ENV:
+        return True
+    if st.query_params.get("profile") != "1":
+        return False
+    token = st.query_params.get("token", "")
+    # Query params survive reruns: drop them so only this rerun is profiled and
+    # the token doesn't stay in the address bar or browser history.
+    for name in ("profile", "token"):
+        if name in st.query_params:
+            del st.query_params[name]
+    # compare bytes: compare_digest raises TypeError on non-ASCII str
+    return bool(PROFILE_TOKEN) and hmac.compare_digest(token.encode(), PROFILE_TOKEN.encode())
+
+
+def start():
+    if PROFILER == "sampling":
+        from pyinstrument import Profiler  # optional dependency, only needed for this mode
+
+        profiler = Profiler()
+        profiler.start()
+    else:
+        profiler = cProfile.Profile()
+        profiler.enable()
+    return profiler
+
+
+def stop(profiler, render=True):
+    """Stop `profiler`, save its output to PROFILE_DIR and, if `render`, show a summary in an expander."""
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    name = time.strftime("rerun-%Y%m%d-%H%M%S") + f"-{uuid.uuid4().hex[:8]}"
+    path = os.path.join(PROFILE_DIR, name)
+    if isinstance(profiler, cProfile.Profile):
+        profiler.disable()
+        path += ".pstats"
+        profiler.dump_stats(path)
+        out = io.StringIO()
+        pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(TOP_N)
+        summary = out.getvalue()
+    else:
+        profiler.stop()
+        path += ".html"
+        with open(path, "w") as f:
+            f.write(profiler.output_html())
+        summary = profiler.output_text(unicode=True)
+
+    if render:
+        with st.expander("⏱️ Profile of this rerun"):
+            st.caption(f"Saved to {path}")
+            st.code(summary, language="text")
+    return path
+
+
+@contextmanager
+def profile_rerun():
+    """Profile the enclosed script run if requested(); a no-op otherwise.
+
+    The profiler is always stopped and its file saved, even when the run ends
+    with an exception, st.stop() or a Streamlit rerun.
+    """
+    if not requested():
+        yield
+        return
+    profiler = start()
+    try:
+        yield
+    except BaseException:
+        stop(profiler, render=False)
+        raise
+    stop(profiler)
@@ -0,0 +1,129 @@
+import heapq
+import itertools
+import threading
+import time
+from urllib.parse import urlparse
+
+# Lower value = served first
+INTERACTIVE = 0
+PREFETCH = 1
+
+# Upper bounds (seconds) of the wait-time histogram buckets
+WAIT_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1.0, 2.0, 5.0, float("inf"))
+
+
+class QueueFull(Exception):
+    """Raised when a request can't get a slot: the host queue is full or the wait timed out."""
+
+
+class TokenBucket:
+    """Token bucket with a bounded, priority-ordered wait queue."""
+
+    def __init__(self, rate, burst=1, max_queue=20, max_wait=5.0, prefetch_queue=None):
+        self.rate = rate
+        self.burst = burst
+        self.max_queue = max_queue
+        # PREFETCH requests may only use part of the queue so page loads always find a slot
+        self.prefetch_queue = max_queue // 2 if prefetch_queue is None else prefetch_queue
+        self.max_wait = max_wait
+        self._tokens = float(burst)
+        self._last = time.monotonic()
+        self._cond = threading.Condition()
+        self._waiters = []
+        self._seq = itertools.count()
+        self.granted = 0
+        self.rejected = 0
+        self.prefetch_failed = 0
+        self.max_depth = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.wait_histogram = [0] * len(WAIT_BUCKETS)
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def acquire(self, priority=INTERACTIVE, timeout=None):
+        timeout = self.max_wait if timeout is None else timeout
+        start = time.monotonic()
+        deadline = start + timeout
+        with self._cond:
+            limit = self.max_queue if priority <= INTERACTIVE else self.prefetch_queue
+            if len(self._waiters) >= limit:
+                self.rejected += 1
+                raise QueueFull(f"queue full ({len(self._waiters)} waiting)")
+            ticket = (priority, next(self._seq))
+            heapq.heappush(self._waiters, ticket)
+            self.max_depth = max(self.max_depth, len(self._waiters))
+            while True:
+                self._refill()
+                if self._waiters[0] == ticket and self._tokens >= 1:
+                    heapq.heappop(self._waiters)
+                    self._tokens -= 1
+                    self._record_wait(time.monotonic() - start)
+                    self._cond.notify_all()
+                    return
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._waiters.remove(ticket)
+                    heapq.heapify(self._waiters)
+                    self.rejected += 1
+                    self._cond.notify_all()
+                    raise QueueFull(f"no slot within {timeout:.1f}s")
+                next_token = max(0.0, (1 - self._tokens) / self.rate)
+                self._cond.wait(min(remaining, next_token or remaining))
+
+    def _record_wait(self, waited):
+        self.granted += 1
+        self.wait_total += waited
+        self.wait_max = max(self.wait_max, waited)
+        for i, bound in enumerate(WAIT_BUCKETS):
+            if waited <= bound:
+                self.wait_histogram[i] += 1
+                break
+
+    def metrics(self):
+        with self._cond:
+            return {
+                "queue_depth": len(self._waiters),
+                "max_queue_depth": self.max_depth,
+                "granted": self.granted,
+                "rejected": self.rejected,
+                "prefetch_failed": self.prefetch_failed,
+                "wait_avg_s": self.wait_total / self.granted if self.granted else 0.0,
+                "wait_max_s": self.wait_max,
+                "wait_histogram": dict(zip(WAIT_BUCKETS, self.wait_histogram)),
+            }
+
+
+class Scheduler:
+    """Process-wide outbound scheduler: one token bucket per host.
+
+    `limits` maps a hostname to TokenBucket kwargs; other hosts get `default`.
+    """
+
+    def __init__(self, limits=None, default=None):
+        self.limits = limits or {}
+        self.default = default or {"rate": 10, "burst": 10}
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def bucket(self, host):
+        with self._lock:
+            if host not in self._buckets:
+                self._buckets[host] = TokenBucket(**self.limits.get(host, self.default))
+            return self._buckets[host]
+
+    def acquire(self, url, priority=INTERACTIVE, timeout=None):
+        self.bucket(urlparse(url).hostname).acquire(priority, timeout)
+
+    def record_prefetch_failure(self, url):
+        bucket = self.bucket(urlparse(url).hostname)
+        with bucket._cond:
+            bucket.prefetch_failed += 1
+
+    def metrics(self):
+        with self._lock:
+            buckets = dict(self._buckets)
+        return {host: b.metrics() for host, b in buckets.items()}
@@ -0,0 +1,101 @@
+import os
+import time
+import uuid
+
+import pytest
+
+from cache import Cache, InFlight, MemoryBackend, RedisBackend, SQLiteBackend, cache_key, decode, encode
+
+REDIS_URL = os.environ.get("YTRUST_TEST_REDIS_URL", "redis://localhost:6379/15")
+PAYLOAD = {"nutri_score": {"Energy_ratio": 0.82, "Fat_ratio": 1.3}, "quantities_g": [{"matched_product": "Tomate"}]}
+
+
+def redis_backend():
+    pytest.importorskip("redis")
+    backend = RedisBackend(REDIS_URL)
+    try:
+        backend.client.ping()
+    except Exception:
+        pytest.skip(f"no Redis-compatible server at {REDIS_URL}")
+    return backend
+
+
+@pytest.fixture(params=["memory", "sqlite", "redis"])
+def cache(request, tmp_path):
+    if request.param == "memory":
+        return Cache(MemoryBackend())
+    if request.param == "sqlite":
+        return Cache(SQLiteBackend(str(tmp_path / "cache.sqlite3")))
+    return Cache(redis_backend())
+
+
+@pytest.fixture
+def key():
+    return cache_key("test", uuid.uuid4().hex)
+
+
+def test_encode_roundtrip():
+    expires_at, value = decode(encode(PAYLOAD, 60))
+    assert value == PAYLOAD
+    assert time.time() < expires_at <= time.time() + 60
+
+
+def test_miss_then_hit(cache, key):
+    assert cache.get(key) is None
+    cache.set(key, PAYLOAD, ttl=60)
+    assert cache.get(key) == PAYLOAD
+
+
+def test_expired_entry_is_a_miss_but_readable_stale(cache, key):
+    cache.set(key, PAYLOAD, ttl=-1)
+    assert cache.get(key) is None
+    assert cache.get(key, stale=True) == PAYLOAD
+
+
+def test_corrupt_value_is_a_miss(cache, key):
+    cache.backend.set(key, b"\x00\x01\x02\x03\x04", 60)
+    assert cache.get(key) is None
+    assert cache.get(key, stale=True) is None
+
+
+def test_latency_histogram_counts_operations(cache, key):
+    cache.set(key, PAYLOAD)
+    cache.get(key)
+    histogram = cache.latency_histogram()
+    assert sum(histogram["get"].values()) == 1
+    assert sum(histogram["set"].values()) == 1
+
+
+def test_memory_backend_evicts_least_recently_used():
+    cache = Cache(MemoryBackend(max_entries=2))
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1 and cache.get("c") == 3
+
+
+def test_sqlite_backend_prunes_expired_rows(tmp_path):
+    backend = SQLiteBackend(str(tmp_path / "cache.sqlite3"))
+    backend.set("old", b"x", -1)
+    backend.set("new", b"y", 60)
+    backend.prune()
+    rows = backend._connect().execute("SELECT key FROM cache").fetchall()
+    assert rows == [("new",)]
+
+
+def test_sqlite_backend_is_shared_between_instances(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    Cache(SQLiteBackend(path)).set("k", PAYLOAD)
+    assert Cache(SQLiteBackend(path)).get("k") == PAYLOAD
+
+
+def test_inflight_lets_only_the_first_caller_load():
+    inflight = InFlight()
+    leader, event = inflight.begin("k")
+    follower, same_event = inflight.begin("k")
+    assert leader and not follower and event is same_event
+    inflight.end("k")
+    assert event.is_set()
+    assert inflight.begin("k")[0]
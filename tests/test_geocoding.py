@@ -0,0 +1,87 @@
+import pytest
+import requests
+from streamlit.testing.v1 import AppTest
+
+
+class FakeResponse:
+    def __init__(self, data):
+        self.data = data
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self.data
+
+
+@pytest.fixture
+def geocode_requests(monkeypatch):
+    sent = []
+
+    def post(url, json=None):
+        if url.endswith("recipescore"):
+            return FakeResponse({"nutri_score": {"Energy_ratio": 0.9}})
+        return FakeResponse({"quantities_g": [{"matched_product": "Tomate", "country_code": 1}]})
+
+    def get(url, params=None, headers=None):
+        sent.append(params["q"])
+        return FakeResponse([{"lat": "48.86", "lon": "2.33"}])
+
+    monkeypatch.setattr(requests, "post", post)
+    monkeypatch.setattr(requests, "get", get)
+    return sent
+
+
+def locate(at, address):
+    at.text_input(key="user_address").input(address)
+    next(b for b in at.button if b.label == "Locate").click()
+    at.run()
+
+
+def test_address_is_geocoded_once_per_session(geocode_requests):
+    at = AppTest.from_file("../app.py", default_timeout=30)
+    at.query_params["metrics"] = "1"
+    at.run()
+    at.text_input(key="recipe_input").input("bolognese")
+    at.button[0].click()
+    at.run()
+    at.selectbox(key="meal_select").select("lunch").run()
+
+    at.text_input(key="user_address").input("15 rue de la Paix, Paris").run()
+    assert geocode_requests == []  # typing alone doesn't geocode
+
+    locate(at, "15 rue de la Paix, Paris")
+    at.selectbox(key="meal_select").select("dinner").run()
+    at.selectbox(key="meal_select").select("breakfast").run()
+    locate(at, "15  rue de la paix, paris")
+
+    assert not at.exception
+    assert geocode_requests == ["15 rue de la paix, paris"]
+    assert at.session_state["user_location"]["lat"] == 48.86
+    assert at.json[0].value and '"requests_this_session": 1' in at.json[0].value
+
+
+def test_known_address_and_last_location_skip_the_debounce(geocode_requests):
+    at = AppTest.from_file("../app.py", default_timeout=30)
+    at.query_params["metrics"] = "1"
+    at.run()
+    at.text_input(key="recipe_input").input("bolognese")
+    at.button[0].click()
+    at.run()
+    at.selectbox(key="meal_select").select("lunch").run()
+
+    locate(at, "15 rue de la Paix, Paris")
+    at.session_state["last_geocode_at"] = 0  # skip the wait between two real requests
+    locate(at, "1 place du Tertre, Paris")
+    locate(at, "15 rue de la paix, paris")  # right away: already resolved, no wait needed
+
+    assert not [i for i in at.info if "wait" in i.value]
+    assert len(geocode_requests) == 2
+    assert at.session_state["user_location"]["address"] == "15 rue de la Paix, Paris"
+
+    next(b for b in at.button if b.label.startswith("📌")).click()
+    at.run()
+    assert at.session_state["user_location"]["address"] == "1 place du Tertre, Paris"
+    assert at.text_input(key="user_address").value == "1 place du Tertre, Paris"
+    assert len(geocode_requests) == 2
+    assert '"sessions_geocoding": ' in at.json[0].value
@@ -0,0 +1,48 @@
+import threading
+import time
+
+import pytest
+import requests
+from streamlit.testing.v1 import AppTest
+
+
+class FakeResponse:
+    def __init__(self, data):
+        self.data = data
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self.data
+
+
+@pytest.fixture
+def backend_posts(monkeypatch):
+    sent = []
+    lock = threading.Lock()
+
+    def post(url, json=None):
+        with lock:
+            sent.append(url.rsplit("/", 1)[-1])
+        if url.endswith("recipescore"):
+            return FakeResponse({"nutri_score": {"Energy_ratio": 0.9}})
+        time.sleep(0.5)  # slow enough for the meal pick to overlap the prefetch
+        return FakeResponse({"quantities_g": [{"matched_product": "Tomate", "country_code": 1}]})
+
+    monkeypatch.setattr(requests, "post", post)
+    return sent
+
+
+def test_search_warms_only_the_recipe_and_never_repeats_it(backend_posts):
+    at = AppTest.from_file("../app.py", default_timeout=30)
+    at.run()
+    at.text_input(key="recipe_input").input("ratatouille")
+    at.button[0].click()
+    at.run()
+    assert backend_posts in ([], ["recipe"])  # only the recipe is warmed
+
+    at.selectbox(key="meal_select").select("lunch").run()
+
+    assert not at.exception
+    assert sorted(backend_posts) == ["recipe", "recipescore"]
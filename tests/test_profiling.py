@@ -0,0 +1,54 @@
+import sys
+
+import pytest
+
+import profiling
+
+
+@pytest.fixture
+def profile_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(profiling, "PROFILE_DIR", str(tmp_path))
+    monkeypatch.setattr(profiling, "requested", lambda: True)
+    return tmp_path
+
+
+def test_profiler_is_stopped_and_saved_when_the_run_raises(profile_dir):
+    with pytest.raises(RuntimeError):
+        with profiling.profile_rerun():
+            raise RuntimeError("script failed")
+    assert sys.getprofile() is None
+    assert len(list(profile_dir.glob("*.pstats"))) == 1
+
+
+def test_each_run_gets_its_own_file(profile_dir):
+    paths = {profiling.stop(profiling.start(), render=False) for _ in range(3)}
+    assert len(paths) == 3
+
+
+def test_non_ascii_token_is_rejected(monkeypatch):
+    monkeypatch.setattr(profiling, "PROFILE_TOKEN", "s3cret")
+    monkeypatch.setattr(profiling.st, "query_params", {"profile": "1", "token": "é"})
+    assert profiling.requested() is False
+
+
+def test_only_the_requested_rerun_is_profiled(tmp_path, monkeypatch):
+    import requests
+    from streamlit.testing.v1 import AppTest
+
+    def offline(*args, **kwargs):
+        raise requests.ConnectionError("offline")
+
+    monkeypatch.setattr(requests, "post", offline)
+    monkeypatch.setattr(profiling, "PROFILE_DIR", str(tmp_path))
+    monkeypatch.setattr(profiling, "PROFILE_TOKEN", "s3cret")
+    at = AppTest.from_file("../app.py", default_timeout=30)
+    at.query_params["profile"] = "1"
+    at.query_params["token"] = "s3cret"
+    at.run()
+    assert len(list(tmp_path.iterdir())) == 1
+    assert "token" not in at.query_params and "profile" not in at.query_params
+
+    at.text_input(key="recipe_input").input("bolognese")
+    at.button[0].click()
+    at.run()
+    assert len(list(tmp_path.iterdir())) == 1
@@ -0,0 +1,82 @@
+import threading
+import time
+
+import pytest
+
+from scheduler import INTERACTIVE, PREFETCH, QueueFull, Scheduler, TokenBucket
+
+
+def start_waiters(bucket, priorities, served):
+    threads = []
+    for n, priority in enumerate(priorities):
+        def run(n=n, priority=priority):
+            try:
+                bucket.acquire(priority)
+                served.append(n)
+            except QueueFull:
+                served.append(("rejected", n))
+
+        thread = threading.Thread(target=run)
+        thread.start()
+        threads.append(thread)
+        time.sleep(0.02)  # enqueue in a known order
+    return threads
+
+
+def test_interactive_requests_go_ahead_of_prefetch():
+    bucket = TokenBucket(rate=5, burst=1, max_queue=10, prefetch_queue=10)
+    bucket.acquire()  # drain the only token so the next requests queue up
+    served = []
+    for thread in start_waiters(bucket, [PREFETCH, PREFETCH, INTERACTIVE], served):
+        thread.join()
+    assert served == [2, 0, 1]
+
+
+def test_full_queue_rejects_immediately():
+    bucket = TokenBucket(rate=5, burst=1, max_queue=1, max_wait=1.0)
+    bucket.acquire()
+    served = []
+    threads = start_waiters(bucket, [INTERACTIVE], served)
+    start = time.monotonic()
+    with pytest.raises(QueueFull):
+        bucket.acquire()
+    assert time.monotonic() - start < 0.1
+    for thread in threads:
+        thread.join()
+    assert bucket.metrics()["rejected"] == 1
+
+
+def test_prefetch_only_uses_part_of_the_queue():
+    bucket = TokenBucket(rate=5, burst=1, max_queue=2, max_wait=1.0)
+    bucket.acquire()
+    served = []
+    threads = start_waiters(bucket, [INTERACTIVE], served)
+    with pytest.raises(QueueFull):
+        bucket.acquire(PREFETCH)
+    for thread in threads:
+        thread.join()
+    assert served == [0]
+
+
+def test_wait_times_out():
+    bucket = TokenBucket(rate=0.1, burst=1, max_wait=0.05)
+    bucket.acquire()
+    with pytest.raises(QueueFull):
+        bucket.acquire()
+    assert bucket.metrics()["queue_depth"] == 0
+
+
+def test_scheduler_keeps_one_bucket_per_host():
+    scheduler = Scheduler({"slow.example": {"rate": 1, "burst": 1}})
+    scheduler.acquire("https://slow.example/search?q=x")
+    scheduler.acquire("https://fast.example/api")
+    metrics = scheduler.metrics()
+    assert set(metrics) == {"slow.example", "fast.example"}
+    assert metrics["slow.example"]["granted"] == 1
+    assert scheduler.bucket("slow.example").rate == 1
+
+
+def test_prefetch_failures_are_counted_per_host():
+    scheduler = Scheduler()
+    scheduler.record_prefetch_failure("https://backend.example/api/recipe")
+    assert scheduler.metrics()["backend.example"]["prefetch_failed"] == 1